@@ -1,13 +1,17 @@
 from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, jsonify, current_app, flash
 import os
+import hmac
 from datetime import datetime
 from dotenv import load_dotenv  # <-- NEW
-import psycopg2
 from psycopg2 import Error
 from psycopg2.extras import RealDictCursor
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
 import time
+from ratelimit import RateLimiter, MemoryBucketBackend, PostgresBucketBackend
+from db import ConnectionPool
+from fragment_cache import FragmentCache
+import stats
 
 
 
@@ -37,6 +41,29 @@ app.config["DB_USER"] = os.getenv("DBUSER", "neondb_owner")
 app.config["DB_PASSWORD"] = os.getenv("DBPASSWORD", "npg_amlCENp4dF7Q")
 app.config["DB_HOST"] = os.getenv("DBHOST", "ep-round-resonance-adiv96hj-pooler.c-2.us-east-1.aws.neon.tech")
 app.config["DB_PORT"] = os.getenv("DBPORT", "5432")
+# Pooled connections per process; match the number of request threads.
+app.config["DB_POOL_MAX"] = int(os.getenv("DB_POOL_MAX", "16"))
+app.config["DB_POOL_TIMEOUT"] = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# ---------- RATE LIMIT CONFIG ----------
+# "memory" keeps buckets per process, "postgres" shares them across workers
+# (needs migrations/003_rate_limit_buckets.sql).
+app.config["RATELIMIT_BACKEND"] = os.getenv("RATELIMIT_BACKEND", "memory")
+# Connections for the shared backend; match the number of request threads.
+app.config["RATELIMIT_DB_POOL_MAX"] = int(os.getenv("RATELIMIT_DB_POOL_MAX", "16"))
+# Per-endpoint overrides of ratelimit.DEFAULT_LIMITS, e.g.
+# {"search": {"rate": 10, "burst": 40, "max_concurrent": 16, "latency_target": 0.2}}
+app.config["RATE_LIMITS"] = {}
+# Lets dashboards scrape /metrics/* without an admin session
+# (sent as "Authorization: Bearer <token>"). Unset disables token access.
+app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN")
+
+# ---------- FRAGMENT CACHE CONFIG ----------
+app.config["FRAGMENT_CACHE_MAX_BYTES"] = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", 4 * 1024 * 1024))
+
+# ---------- STATS CONFIG ----------
+# How often precomputed dashboard stats are recounted from scratch; 0 disables.
+app.config["STATS_RECONCILE_SECONDS"] = int(os.getenv("STATS_RECONCILE_SECONDS", "3600"))
 
 # ---------- DATABASE CONNECTION ----------
 def init_db():
@@ -76,19 +103,38 @@ def init_db():
         if conn:
             conn.close()
 
+def db_connect_kwargs():
+    return dict(
+        dbname=app.config["DB_NAME"],
+        user=app.config["DB_USER"],
+        password=app.config["DB_PASSWORD"],
+        host=app.config["DB_HOST"],
+        port=app.config["DB_PORT"],
+        sslmode="require",
+        # Notice connections Neon dropped while they sat idle in the pool.
+        keepalives=1,
+        keepalives_idle=30,
+    )
+
+# Built by create_app() from the final config.
+db_pool = None
+
+def init_db_pool():
+    global db_pool
+    old_pool = db_pool
+    db_pool = ConnectionPool(app.config["DB_POOL_MAX"], app.config["DB_POOL_TIMEOUT"],
+                             **db_connect_kwargs())
+    if old_pool:
+        old_pool.close_all()
+
 def get_db_connection():
     try:
-        conn = psycopg2.connect(
-            dbname=app.config["DB_NAME"],
-            user=app.config["DB_USER"],
-            password=app.config["DB_PASSWORD"],
-            host=app.config["DB_HOST"],
-            port=app.config["DB_PORT"],
-            sslmode="require"
-        )
-        return conn
+        if db_pool is None:
+            init_db_pool()
+        return db_pool.connect()
     except Exception as e:
-        current_app.logger.error(f"DB connection failed: {e}")
+        # Also called outside requests (stats reconciler), so no current_app.
+        app.logger.error(f"DB connection failed: {e}")
         return None
 
 # ---------- DATABASE SETUP ----------
@@ -140,7 +186,61 @@ def init_db():
     finally:
         conn.close()
 
-init_db()
+# ---------- RATE LIMITING ----------
+def init_rate_limiter():
+    if isinstance(limiter.backend, PostgresBucketBackend):
+        limiter.backend.close()
+    backend = MemoryBucketBackend()
+    if app.config["RATELIMIT_BACKEND"] == "postgres":
+        # Its own pool, so limiter checks never wait behind route queries.
+        pool = ConnectionPool(app.config["RATELIMIT_DB_POOL_MAX"], app.config["DB_POOL_TIMEOUT"],
+                              **db_connect_kwargs())
+        backend = PostgresBucketBackend(pool)
+    limiter.init_app(app, backend=backend)
+
+limiter = RateLimiter()
+
+# ---------- FRAGMENT CACHE ----------
+fragment_cache = FragmentCache()
+
+def render_cards(kind, rows, template, name, row_id=lambda row: row[0]):
+    """Pair each row with its cached card markup for the list templates."""
+    return [
+        (row, fragment_cache.get_or_render(
+            kind, row_id(row), fragment_cache.version_of(row),
+            lambda row=row: render_template(template, **{name: row})
+        ))
+        for row in rows
+    ]
+
+# ---------- APP FACTORY ----------
+def create_app(config=None):
+    """Apply config overrides, prepare the database and limiters, return the app.
+
+    Used by both entry points: ``python app.py`` (dev server) and ``asgi.py``
+    (production, see gunicorn.conf.py). Safe to call again with new overrides:
+    pools and limiters are rebuilt, the stats reconciler is started only once.
+    """
+    if config:
+        app.config.update(config)
+    init_db_pool()
+    init_db()
+    init_rate_limiter()
+    fragment_cache.max_bytes = app.config["FRAGMENT_CACHE_MAX_BYTES"]
+    init_stats_reconciler()
+    return app
+
+# ---------- STATS ----------
+stats_reconciler = None
+
+def init_stats_reconciler():
+    # Tables, triggers and the initial counts come from
+    # migrations/002_dashboard_stats.sql; this only corrects drift.
+    global stats_reconciler
+    interval = app.config["STATS_RECONCILE_SECONDS"]
+    if interval > 0 and stats_reconciler is None:
+        stats_reconciler = stats.start_reconciler(interval, get_db_connection,
+                                                  app.config["UPLOAD_FOLDER"], app.logger)
 
 # ---------- ROUTES ----------
 
@@ -150,6 +250,7 @@ def index():
 
 # ---------- LOGIN ----------
 @app.route("/login", methods=["GET","POST"])
+@limiter.limit("login")
 def login():
     if request.method == "POST":
         username = request.form.get("username", "").strip()
@@ -241,7 +342,34 @@ def logout():
 def dashboard():
     if "username" not in session:
         return redirect(url_for("login"))
-    return render_template("dashboard.html", title="Dashboard", role=session["role"])
+
+    admin_stats = None
+    if session["role"] == "admin":
+        try:
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                admin_stats = stats.read_stats(cur)
+            conn.close()
+        except Exception as e:
+            current_app.logger.error(f"Dashboard stats failed: {e}")
+
+    return render_template("dashboard.html", title="Dashboard", role=session["role"],
+                           stats=admin_stats)
+
+@app.route("/api/dashboard/stats")
+def dashboard_stats():
+    if "username" not in session or session["role"] != "admin":
+        return jsonify({'error': 'forbidden'}), 403
+
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            data = stats.read_stats(cur)
+        conn.close()
+        return jsonify(data)
+    except Exception as e:
+        current_app.logger.exception("Dashboard stats error")
+        return jsonify({'error': 'server error', 'details': str(e)}), 500
 
 # ---------- PROFILE ----------
 @app.route("/profile", methods=["GET", "POST"])
@@ -434,8 +562,8 @@ def notes():
 
             conn = get_db_connection()
             c = conn.cursor()
-            c.execute("INSERT INTO notes (filename, uploaded_by) VALUES (%s, %s)",
-                      (file.filename, session["username"]))
+            c.execute("INSERT INTO notes (filename, uploaded_by, size_bytes) VALUES (%s, %s, %s)",
+                      (file.filename, session["username"], os.path.getsize(filepath)))
             conn.commit()
             conn.close()
 
@@ -446,6 +574,8 @@ def notes():
     files = c.fetchall()
     conn.close()
 
+    files = render_cards("note", files, "_note_card.html", "note")
+
     return render_template("notes.html", title="Notes", files=files, role=session["role"])
 
 # Download file
@@ -470,6 +600,7 @@ def delete_note(note_id):
         if session["role"] in ["teacher", "admin"] or session["username"] == uploader:
             c.execute("DELETE FROM notes WHERE id=%s", (note_id,))
             conn.commit()
+            fragment_cache.invalidate("note", note_id)
             current_app.logger.info(f"Note deleted: {filename}")
 
             # Delete file from uploads
@@ -524,6 +655,9 @@ def announcements():
         announcements = []
         flash(f"⚠️ Database error: {str(e)}", "error")
 
+    announcements = render_cards("announcement", announcements, "_announcement_card.html",
+                                 "announcement", row_id=lambda row: row["id"])
+
     return render_template(
         "announcements.html",
         title="Announcements",
@@ -555,6 +689,7 @@ def delete_announcement(ann_id):
         if session["role"] in ["teacher", "admin"] or (session["username"] == author):
             cur.execute("DELETE FROM announcements WHERE id = %s", (ann_id,))
             conn.commit()
+            fragment_cache.invalidate("announcement", ann_id)
             conn.close()
             flash("🗑️ Announcement deleted successfully!", "success")
         else:
@@ -567,7 +702,25 @@ def delete_announcement(ann_id):
 
 
 # ---------- SEARCH ----------
+# Shared with the async /search in asgi.py; {} is the driver's placeholder.
+SEARCH_SQL = "SELECT id, filename, uploaded_by FROM notes WHERE filename ILIKE {} LIMIT 12"
+
+def search_pattern(q):
+    # search filename (case-insensitive)
+    return f"%{q}%"
+
+def search_results(rows):
+    return [
+        {
+            'id': r[0],
+            'title': r[1],
+            'excerpt': f"Uploaded by: {r[2]}"
+        }
+        for r in rows
+    ]
+
 @app.route('/search')
+@limiter.limit("search", json_errors=True)
 def search_notes():
     q = request.args.get('q', '').strip()
     if not q:
@@ -576,25 +729,35 @@ def search_notes():
     try:
         conn = get_db_connection()
         c = conn.cursor()
-        # search filename (case-insensitive)
-        pattern = f"%{q}%"
-        c.execute("SELECT id, filename, uploaded_by FROM notes WHERE filename ILIKE %s LIMIT 12", (pattern,))
+        c.execute(SEARCH_SQL.format("%s"), (search_pattern(q),))
         rows = c.fetchall()
         conn.close()
-
-        results = [
-            {
-                'id': r[0],
-                'title': r[1],
-                'excerpt': f"Uploaded by: {r[2]}"
-            }
-            for r in rows
-        ]
-        return jsonify(results)
+        return jsonify(search_results(rows))
     except Exception as e:
         current_app.logger.exception("Search error")
         return jsonify({'error': 'server error', 'details': str(e)}), 500
 
+# ---------- METRICS ----------
+def metrics_allowed():
+    if session.get("role") == "admin":
+        return True
+    token = app.config["METRICS_TOKEN"]
+    supplied = request.headers.get("Authorization", "")
+    # Compare bytes: compare_digest rejects non-ASCII str with TypeError.
+    return bool(token) and hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+@app.route("/metrics/rate_limits")
+def rate_limit_metrics():
+    if not metrics_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify(limiter.snapshot())
+
+@app.route("/metrics/fragment_cache")
+def fragment_cache_metrics():
+    if not metrics_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify(fragment_cache.stats())
+
 # ---------- EDIT NOTE ----------
 @app.route("/edit_note/<int:note_id>", methods=["GET", "POST"])
 def edit_note(note_id):
@@ -610,6 +773,7 @@ def edit_note(note_id):
         if new_title and new_content:
             c.execute("UPDATE notes SET title=%s, content=%s WHERE id=%s", (new_title, new_content, note_id))
             conn.commit()
+            fragment_cache.invalidate("note", note_id)
             conn.close()
             return redirect(url_for("notes"))
 
@@ -741,6 +905,5 @@ def delete_user(user_id):
 
 # ---------- RUN ----------
 if __name__ == "__main__":
-    # Initialize database before starting the app
-    init_db()
-    app.run(debug=True)
+    # Development server only; production runs asgi:app under gunicorn
+    create_app().run(debug=True)
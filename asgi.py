@@ -0,0 +1,111 @@
+"""Production ASGI entry point: ``gunicorn -c gunicorn.conf.py asgi:app``.
+
+The I/O-bound routes that are hit the most are served natively on the event
+loop so an idle or slow client only costs a coroutine, not a thread:
+
+* ``/search``             -> asyncpg pool
+* ``/uploads/<filename>`` -> file streamed in chunks without blocking the loop
+
+Everything else is the unchanged Flask app, mounted through a WSGI adapter
+that runs it on ``WSGI_THREADS`` threads with pooled psycopg2 connections
+(see db.py). Those routes still hold a thread for each DB round trip. URLs
+and templates are the same in both modes.
+"""
+import contextlib
+import math
+import os
+
+import asyncpg
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse
+from starlette.routing import Mount, Route
+from werkzeug.security import safe_join
+
+from app import create_app, limiter, SEARCH_SQL, search_pattern, search_results
+
+flask_app = create_app()
+
+# ---------- ASYNC DB POOL ----------
+ASYNC_DB_POOL_MIN = int(os.getenv("ASYNC_DB_POOL_MIN", "1"))
+ASYNC_DB_POOL_MAX = int(os.getenv("ASYNC_DB_POOL_MAX", "10"))
+# Threads serving the mounted Flask routes, per process.
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "16"))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    app.state.db = await asyncpg.create_pool(
+        database=flask_app.config["DB_NAME"],
+        user=flask_app.config["DB_USER"],
+        password=flask_app.config["DB_PASSWORD"],
+        host=flask_app.config["DB_HOST"],
+        port=int(flask_app.config["DB_PORT"]),
+        ssl="require",
+        min_size=ASYNC_DB_POOL_MIN,
+        max_size=ASYNC_DB_POOL_MAX,
+        # Neon's pooler runs PgBouncer in transaction mode, which can't keep
+        # named prepared statements across transactions.
+        statement_cache_size=0,
+    )
+    try:
+        yield
+    finally:
+        await app.state.db.close()
+
+
+# ---------- RATE LIMITING ----------
+def session_username(request):
+    """Read the username out of Flask's signed session cookie."""
+    cookie = request.cookies.get(flask_app.config.get("SESSION_COOKIE_NAME", "session"))
+    if not cookie:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        return serializer.loads(cookie).get("username")
+    except Exception:
+        return None
+
+
+def identify(request):
+    # No peer address on a UNIX socket; all such clients share one IP bucket.
+    remote_addr = request.client.host if request.client else "unknown"
+    return session_username(request), remote_addr
+
+
+def rejected(status, message, retry_after):
+    return JSONResponse({"error": message}, status_code=status,
+                        headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+# ---------- SEARCH ----------
+@limiter.limit_async("search", identify, rejected)
+async def search_notes(request):
+    q = request.query_params.get("q", "").strip()
+    if not q:
+        return JSONResponse([])
+
+    try:
+        rows = await request.app.state.db.fetch(SEARCH_SQL.format("$1"), search_pattern(q))
+        return JSONResponse(search_results(rows))
+    except Exception as e:
+        flask_app.logger.exception("Search error")
+        return JSONResponse({'error': 'server error', 'details': str(e)}, status_code=500)
+
+
+# ---------- DOWNLOAD ----------
+async def uploaded_file(request):
+    path = safe_join(flask_app.config["UPLOAD_FOLDER"], request.path_params["filename"])
+    if path is None or not os.path.isfile(path):
+        return PlainTextResponse("Not Found", status_code=404)
+    return FileResponse(path)
+
+
+app = Starlette(
+    routes=[
+        Route("/search", search_notes),
+        Route("/uploads/{filename}", uploaded_file),
+        Mount("/", app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+    ],
+    lifespan=lifespan,
+)
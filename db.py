@@ -0,0 +1,105 @@
+"""Pooled psycopg2 connections for the Flask routes.
+
+Opening a TLS connection to Neon costs several round trips, so connections
+are kept open and reused. Routes keep calling ``conn.close()`` as before;
+on a pooled connection that rolls back anything left open and hands it back.
+A connection that is dropped without ``close()`` (an early return or an
+exception) goes back to the pool when it is garbage collected.
+"""
+import threading
+
+import psycopg2
+from psycopg2.pool import PoolError
+
+
+class PooledConnection:
+    """A psycopg2 connection borrowed from a ConnectionPool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.put(conn)
+
+    def __del__(self):
+        self.close()
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise AttributeError(f"connection already closed ({name})")
+        return getattr(conn, name)
+
+
+class ConnectionPool:
+    """Thread-safe pool that waits for a free connection instead of failing.
+
+    Up to ``max_connections`` are open at once. Connections are opened on
+    demand and kept idle once returned, so importing the app doesn't touch
+    the database and a warm process doesn't reconnect.
+    """
+
+    def __init__(self, max_connections, timeout, connect=psycopg2.connect, **connect_kwargs):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._connect = connect
+        self._connect_kwargs = connect_kwargs
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._closed = False
+
+    def connect(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError("timed out waiting for a database connection")
+        try:
+            conn = self._pop_idle()
+            if conn is None:
+                conn = self._connect(**self._connect_kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(self, conn)
+
+    def _pop_idle(self):
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.closed:
+                    return conn
+        return None
+
+    def put(self, conn):
+        # Anything that can't be rolled back cleanly (e.g. Neon dropped the
+        # socket while it sat idle) is discarded instead of reused.
+        try:
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            if broken or self._closed:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Close the idle connections; borrowed ones close when returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,83 @@
+"""Cache of rendered card fragments for the notes and announcements lists.
+
+Cards are the same for every viewer, so each one is rendered once per
+(kind, row id, version) and reused. Per-user parts such as the delete button
+stay in the page template and are rendered on top of the cached markup.
+
+The version is the row's column values, so an edited row renders fresh
+even if nobody invalidated it. Deletes and edits still call ``invalidate`` so
+stale markup doesn't sit in memory. Entries are evicted least-recently-used
+once the total size goes over ``max_bytes``.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+
+class FragmentCache:
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (kind, row_id) -> (version, html, size)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def version_of(row):
+        """Version stamp for a DB row (tuple or dict); compared by equality."""
+        if isinstance(row, dict):
+            return tuple(row.values())
+        return tuple(row)
+
+    def get_or_render(self, kind, row_id, version, render):
+        """Return cached markup for the row, calling ``render()`` on a miss."""
+        key = (kind, row_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        html = Markup(render())
+        # The version holds the row's values, so count it against the budget too.
+        size = sys.getsizeof(html) + sum(sys.getsizeof(v) for v in version)
+        if size > self.max_bytes:
+            return html
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (version, html, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+        return html
+
+    def invalidate(self, kind, row_id):
+        with self._lock:
+            self._discard((kind, row_id))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
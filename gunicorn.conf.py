@@ -0,0 +1,33 @@
+# Production server settings: gunicorn -c gunicorn.conf.py asgi:app
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Each uvicorn worker is one event loop; idle keep-alive and long-poll
+# connections cost a coroutine, so one worker per core is enough.
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Keep connections open longer than the platform router's idle timeout.
+keepalive = int(os.getenv("KEEPALIVE", "75"))
+timeout = int(os.getenv("TIMEOUT", "60"))
+graceful_timeout = 30
+
+# Recycle workers now and then so slow leaks can't build up.
+max_requests = 5000
+max_requests_jitter = 500
+
+# Each worker opens its own DB pools, so don't load the app in the master.
+preload_app = False
+
+# Only trust X-Forwarded-For from the proxy in front of us; clients can put
+# anything in that header, and the rate limiter keys on the resulting IP.
+# Set FORWARDED_ALLOW_IPS to the router / load balancer address(es) of the
+# platform (comma separated). Left unset, only 127.0.0.1 is trusted.
+if os.getenv("FORWARDED_ALLOW_IPS"):
+    forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS")
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
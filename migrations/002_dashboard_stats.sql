@@ -0,0 +1,141 @@
+-- Precomputed dashboard statistics (see stats.py)
+-- Apply once before deploying: psql "$DATABASE_URL" -f migrations/002_dashboard_stats.sql
+-- notes.size_bytes is filled in from disk by the first periodic reconcile.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS announcements (
+    id SERIAL PRIMARY KEY,
+    content TEXT NOT NULL,
+    author TEXT NOT NULL,
+    date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS size_bytes BIGINT;
+
+CREATE TABLE IF NOT EXISTS stats_counters (
+    name TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stats_uploaders (
+    uploaded_by TEXT PRIMARY KEY,
+    notes BIGINT NOT NULL DEFAULT 0,
+    bytes BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS activity_log (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    action TEXT NOT NULL,
+    actor TEXT,
+    detail TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION stats_bump(counter TEXT, delta BIGINT) RETURNS void AS $$
+    INSERT INTO stats_counters (name, value) VALUES (counter, delta)
+    ON CONFLICT (name) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION stats_users_trg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM stats_bump('users.' || COALESCE(NEW.role, 'student'), 1);
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM stats_bump('users.' || COALESCE(OLD.role, 'student'), -1);
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO activity_log (kind, action, actor, detail)
+        VALUES ('user', 'registered', NEW.username, NEW.role);
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO activity_log (kind, action, actor, detail)
+        VALUES ('user', 'deleted', OLD.username, OLD.role);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_notes_trg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM stats_bump('notes.total', 1);
+        PERFORM stats_bump('storage.bytes', COALESCE(NEW.size_bytes, 0));
+        INSERT INTO stats_uploaders (uploaded_by, notes, bytes)
+        VALUES (NEW.uploaded_by, 1, COALESCE(NEW.size_bytes, 0))
+        ON CONFLICT (uploaded_by) DO UPDATE SET
+            notes = stats_uploaders.notes + 1,
+            bytes = stats_uploaders.bytes + EXCLUDED.bytes;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM stats_bump('notes.total', -1);
+        PERFORM stats_bump('storage.bytes', -COALESCE(OLD.size_bytes, 0));
+        UPDATE stats_uploaders
+        SET notes = notes - 1, bytes = bytes - COALESCE(OLD.size_bytes, 0)
+        WHERE uploaded_by = OLD.uploaded_by;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO activity_log (kind, action, actor, detail)
+        VALUES ('note', 'uploaded', NEW.uploaded_by, NEW.filename);
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO activity_log (kind, action, actor, detail)
+        VALUES ('note', 'deleted', OLD.uploaded_by, OLD.filename);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_announcements_trg() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM stats_bump('announcements.total', 1);
+        INSERT INTO activity_log (kind, action, actor, detail)
+        VALUES ('announcement', 'posted', NEW.author, LEFT(NEW.content, 80));
+    ELSE
+        PERFORM stats_bump('announcements.total', -1);
+        INSERT INTO activity_log (kind, action, actor, detail)
+        VALUES ('announcement', 'deleted', OLD.author, LEFT(OLD.content, 80));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- An UPDATE is handled as "remove old row, add new row", so only fire on
+-- the columns the counters depend on.
+DROP TRIGGER IF EXISTS stats_users ON users;
+CREATE TRIGGER stats_users AFTER INSERT OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION stats_users_trg();
+DROP TRIGGER IF EXISTS stats_users_role ON users;
+CREATE TRIGGER stats_users_role AFTER UPDATE OF role ON users
+    FOR EACH ROW WHEN (OLD.role IS DISTINCT FROM NEW.role)
+    EXECUTE FUNCTION stats_users_trg();
+
+DROP TRIGGER IF EXISTS stats_notes ON notes;
+CREATE TRIGGER stats_notes AFTER INSERT OR DELETE ON notes
+    FOR EACH ROW EXECUTE FUNCTION stats_notes_trg();
+DROP TRIGGER IF EXISTS stats_notes_size ON notes;
+CREATE TRIGGER stats_notes_size AFTER UPDATE OF size_bytes, uploaded_by ON notes
+    FOR EACH ROW WHEN (OLD.size_bytes IS DISTINCT FROM NEW.size_bytes
+                       OR OLD.uploaded_by IS DISTINCT FROM NEW.uploaded_by)
+    EXECUTE FUNCTION stats_notes_trg();
+
+DROP TRIGGER IF EXISTS stats_announcements ON announcements;
+CREATE TRIGGER stats_announcements AFTER INSERT OR DELETE ON announcements
+    FOR EACH ROW EXECUTE FUNCTION stats_announcements_trg();
+
+-- Seed the counters from the existing rows; the triggers keep them current.
+LOCK TABLE users, notes, announcements IN SHARE MODE;
+DELETE FROM stats_counters;
+INSERT INTO stats_counters (name, value)
+    SELECT 'users.' || COALESCE(role, 'student'), COUNT(*) FROM users GROUP BY 1
+    UNION ALL SELECT 'notes.total', COUNT(*) FROM notes
+    UNION ALL SELECT 'storage.bytes', COALESCE(SUM(size_bytes), 0) FROM notes
+    UNION ALL SELECT 'announcements.total', COUNT(*) FROM announcements
+    UNION ALL SELECT 'reconcile.last_run', EXTRACT(EPOCH FROM now())::BIGINT;
+
+DELETE FROM stats_uploaders;
+INSERT INTO stats_uploaders (uploaded_by, notes, bytes)
+    SELECT uploaded_by, COUNT(*), COALESCE(SUM(size_bytes), 0)
+    FROM notes GROUP BY uploaded_by;
+
+COMMIT;
@@ -0,0 +1,7 @@
+-- Shared token buckets for RATELIMIT_BACKEND=postgres (see ratelimit.py)
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL,
+    full_at DOUBLE PRECISION NOT NULL
+);
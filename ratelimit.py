@@ -0,0 +1,394 @@
+"""Rate limiting and load shedding for the hot routes (/search, /login).
+
+Each limited endpoint gets two independent guards:
+
+* token buckets per client that answer 429 + Retry-After once the client runs
+  out of tokens. Every request draws from a bucket for its remote IP; when the
+  user is known it also draws from a smaller per-user bucket, so one NAT'd
+  classroom shares a generous IP allowance while a single account is still
+  held to its own. For /login the username is just a form field anyone can
+  send, so that bucket is per (username, IP): hammering someone else's
+  account from elsewhere can't lock them out;
+* a concurrency gate shared by every client of the route. Requests queue for
+  a free slot for at most ``latency_target`` seconds and are shed with
+  503 + Retry-After after that. Once the recent average queue time gets close
+  to the target, new requests are shed straight away instead of queueing.
+
+Buckets live in process memory by default. Set ``RATELIMIT_BACKEND=postgres``
+to share them between workers/dynos through the ``rate_limit_buckets`` table.
+"""
+import asyncio
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, request, session, make_response
+
+# ---------- DEFAULTS ----------
+# rate/burst: per-user bucket (tokens refilled per second, bucket size),
+# ip_rate/ip_burst: per-IP bucket, shared by everyone behind the same address,
+# max_concurrent: requests served at once per process,
+# latency_target: max seconds a request may wait for a slot,
+# methods: HTTP methods that are limited (others pass straight through),
+# username_field: form field naming the (unverified) user, for routes hit
+#                 before login; its bucket is also keyed on the IP.
+DEFAULT_LIMITS = {
+    "search": {
+        "rate": 5.0,
+        "burst": 20,
+        "ip_rate": 50.0,
+        "ip_burst": 200,
+        "max_concurrent": 8,
+        "latency_target": 0.25,
+        "methods": ["GET"],
+    },
+    "login": {
+        "rate": 0.2,
+        "burst": 5,
+        "ip_rate": 2.0,
+        "ip_burst": 60,
+        "max_concurrent": 4,
+        "latency_target": 1.0,
+        "methods": ["POST"],
+        "username_field": "username",
+    },
+}
+
+
+THROTTLED = "Too many requests, please slow down!"
+SHED = "Server is busy, please try again shortly!"
+
+
+# ---------- BUCKET BACKENDS ----------
+class MemoryBucketBackend:
+    """Token buckets kept in a dict, private to this process."""
+
+    # Idle buckets are full again after burst / rate seconds, so dropping them
+    # loses nothing. Sweep at most this often to keep the dict bounded.
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def take(self, key, rate, burst):
+        """Take one token. Returns (allowed, retry_after_seconds)."""
+        now = time.monotonic()
+        # Buckets of different endpoints refill at different speeds, so each
+        # one remembers when it will be full again.
+        full_at = now + burst / rate
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (float(burst), now, full_at))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= 1.0:
+                tokens -= 1.0
+                allowed, retry_after = True, 0.0
+            else:
+                allowed, retry_after = False, (1.0 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+
+            if now - self._last_sweep > self.SWEEP_INTERVAL:
+                self._sweep(now)
+        return allowed, retry_after
+
+    def _sweep(self, now):
+        stale = [k for k, (_, _, full_at) in self._buckets.items() if full_at < now]
+        for k in stale:
+            del self._buckets[k]
+        self._last_sweep = now
+
+
+class PostgresBucketBackend:
+    """Token buckets shared between processes through a Postgres table.
+
+    Refill and take happen in a single UPSERT so concurrent workers can't
+    double-spend a token. The database clock is used so dynos with skewed
+    clocks agree on refill timing.
+
+    ``pool`` is a db.ConnectionPool: callers wait for a free connection
+    rather than getting a PoolError, so a burst of traffic queues here
+    instead of switching the limiter off. The table is created by
+    migrations/003_rate_limit_buckets.sql.
+    """
+
+    TAKE_SQL = """
+        INSERT INTO rate_limit_buckets AS b (key, tokens, updated_at, full_at)
+        VALUES (%(key)s, %(burst)s - 1, EXTRACT(EPOCH FROM clock_timestamp()),
+                EXTRACT(EPOCH FROM clock_timestamp()) + 1 / %(rate)s)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = LEAST(%(burst)s, b.tokens +
+                     (EXTRACT(EPOCH FROM clock_timestamp()) - b.updated_at) * %(rate)s) - 1,
+            updated_at = EXTRACT(EPOCH FROM clock_timestamp()),
+            full_at = EXTRACT(EPOCH FROM clock_timestamp()) + (%(burst)s - LEAST(%(burst)s, b.tokens +
+                      (EXTRACT(EPOCH FROM clock_timestamp()) - b.updated_at) * %(rate)s) + 1) / %(rate)s
+        WHERE LEAST(%(burst)s, b.tokens +
+              (EXTRACT(EPOCH FROM clock_timestamp()) - b.updated_at) * %(rate)s) >= 1
+        RETURNING tokens
+    """
+
+    # Buckets past full_at hold nothing a fresh bucket wouldn't.
+    PRUNE_SQL = "DELETE FROM rate_limit_buckets WHERE full_at < EXTRACT(EPOCH FROM clock_timestamp())"
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._prune_lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def take(self, key, rate, burst):
+        conn = self._pool.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(self.TAKE_SQL, {"key": key, "rate": rate, "burst": burst})
+                row = cur.fetchone()
+                if self._prune_due():
+                    cur.execute(self.PRUNE_SQL)
+            conn.commit()
+        finally:
+            # Returning it to the pool rolls back anything left open.
+            conn.close()
+
+        if row:
+            return True, 0.0
+        # Denied: the bucket holds less than one token, so at most 1/rate away.
+        return False, 1.0 / rate
+
+    def close(self):
+        self._pool.close_all()
+
+    def _prune_due(self):
+        now = time.monotonic()
+        with self._prune_lock:
+            if now - self._last_prune < self.PRUNE_INTERVAL:
+                return False
+            self._last_prune = now
+            return True
+
+
+# ---------- CONCURRENCY GATES ----------
+class ConcurrencyGate:
+    """Caps in-flight requests for one route and sheds load when queueing."""
+
+    # Weight of the newest sample in the moving average of queue time.
+    EWMA_ALPHA = 0.2
+    # Waits are capped at latency_target, so the average can only approach
+    # it; start shedding without queueing once it is this close.
+    SHED_THRESHOLD = 0.8
+
+    def __init__(self, max_concurrent, latency_target):
+        self.max_concurrent = max_concurrent
+        self.latency_target = latency_target
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.queue_wait_avg = 0.0
+
+    def _record_wait(self, waited):
+        with self._lock:
+            self.queue_wait_avg += self.EWMA_ALPHA * (waited - self.queue_wait_avg)
+
+    def _overloaded(self):
+        return self.queue_wait_avg >= self.SHED_THRESHOLD * self.latency_target
+
+    def acquire(self):
+        """Wait for a slot. Returns False if the request should be shed."""
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            # Queueing has been taking about the whole target: fail fast.
+            if self._overloaded():
+                return False
+            if not self._slots.acquire(timeout=self.latency_target):
+                self._record_wait(self.latency_target)
+                return False
+        self._record_wait(time.monotonic() - start)
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+
+class AsyncConcurrencyGate(ConcurrencyGate):
+    """Same policy as ConcurrencyGate for handlers running on an event loop."""
+
+    def __init__(self, max_concurrent, latency_target):
+        super().__init__(max_concurrent, latency_target)
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self):
+        start = time.monotonic()
+        if self._slots.locked():
+            if self._overloaded():
+                return False
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.latency_target)
+            except asyncio.TimeoutError:
+                self._record_wait(self.latency_target)
+                return False
+        else:
+            await self._slots.acquire()
+        self._record_wait(time.monotonic() - start)
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+
+# ---------- LIMITER ----------
+class EndpointLimit:
+    """Config, guards and counters for one limited endpoint."""
+
+    def __init__(self, name, rate, burst, max_concurrent, latency_target, methods,
+                 ip_rate=None, ip_burst=None, username_field=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self.ip_rate = float(ip_rate if ip_rate is not None else rate)
+        self.ip_burst = int(ip_burst if ip_burst is not None else burst)
+        self.methods = {m.upper() for m in methods}
+        self.username_field = username_field
+        self.gate = ConcurrencyGate(int(max_concurrent), float(latency_target))
+        # Used instead of ``gate`` by the native async handlers in asgi.py.
+        self.async_gate = AsyncConcurrencyGate(int(max_concurrent), float(latency_target))
+        self._lock = threading.Lock()
+        self.counters = {"allowed": 0, "throttled": 0, "shed": 0, "backend_errors": 0}
+
+    def incr(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.counters)
+        queue_wait_avg = max(self.gate.queue_wait_avg, self.async_gate.queue_wait_avg)
+        data.update({
+            "in_flight": self.gate.in_flight + self.async_gate.in_flight,
+            "max_concurrent": self.gate.max_concurrent,
+            "queue_wait_avg_ms": round(queue_wait_avg * 1000, 2),
+            "latency_target_ms": round(self.gate.latency_target * 1000, 2),
+            "rate": self.rate,
+            "burst": self.burst,
+            "ip_rate": self.ip_rate,
+            "ip_burst": self.ip_burst,
+        })
+        return data
+
+
+class RateLimiter:
+    """Flask integration: ``limiter.init_app(app)`` then ``@limiter.limit("name")``.
+
+    ``limit_async`` applies the same checks and counters to the native
+    handlers in asgi.py.
+
+    Per-endpoint settings come from ``app.config["RATE_LIMITS"]`` and are
+    merged over ``DEFAULT_LIMITS``.
+    """
+
+    def __init__(self):
+        self.backend = MemoryBucketBackend()
+        self.endpoints = {}
+
+    def init_app(self, app, backend=None):
+        if backend is not None:
+            self.backend = backend
+        overrides = app.config.get("RATE_LIMITS", {})
+        for name in set(DEFAULT_LIMITS) | set(overrides):
+            settings = dict(DEFAULT_LIMITS.get(name, {}))
+            settings.update(overrides.get(name, {}))
+            self.endpoints[name] = EndpointLimit(name, **settings)
+
+    def throttle(self, limit, username, remote_addr):
+        """Draw from the client's IP bucket and, if known, its user bucket.
+
+        Returns None when allowed, else seconds until the client may retry.
+        Fails open if the backend is down.
+        """
+        buckets = [(f"{limit.name}:ip:{remote_addr}", limit.ip_rate, limit.ip_burst)]
+        if username:
+            user_key = f"{limit.name}:user:{username.lower()}"
+            if limit.username_field:
+                user_key += f"@{remote_addr}"
+            buckets.append((user_key, limit.rate, limit.burst))
+        for key, rate, burst in buckets:
+            try:
+                allowed, retry_after = self.backend.take(key, rate, burst)
+            except Exception:
+                limit.incr("backend_errors")
+                continue
+            if not allowed:
+                limit.incr("throttled")
+                return retry_after
+        return None
+
+    def limit(self, name, json_errors=False):
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                limit = self.endpoints.get(name)
+                if limit is None or request.method not in limit.methods:
+                    return view(*args, **kwargs)
+
+                if limit.username_field:
+                    username = request.form.get(limit.username_field, "").strip()
+                else:
+                    username = session.get("username")
+                retry_after = self.throttle(limit, username, request.remote_addr)
+                if retry_after is not None:
+                    return _reject(429, THROTTLED, retry_after, json_errors)
+
+                if not limit.gate.acquire():
+                    limit.incr("shed")
+                    return _reject(503, SHED, limit.gate.latency_target, json_errors)
+                try:
+                    limit.incr("allowed")
+                    return view(*args, **kwargs)
+                finally:
+                    limit.gate.release()
+            return wrapped
+        return decorator
+
+    def limit_async(self, name, identify, reject):
+        """Decorator for ``async def handler(request)``.
+
+        ``identify(request)`` returns (username, remote_addr) and
+        ``reject(status, message, retry_after)`` builds the error response.
+        The bucket check runs on a thread since the shared backend blocks.
+        """
+        def decorator(handler):
+            @wraps(handler)
+            async def wrapped(request):
+                limit = self.endpoints.get(name)
+                if limit is None or request.method not in limit.methods:
+                    return await handler(request)
+
+                username, remote_addr = identify(request)
+                retry_after = await asyncio.to_thread(self.throttle, limit, username, remote_addr)
+                if retry_after is not None:
+                    return reject(429, THROTTLED, retry_after)
+
+                if not await limit.async_gate.acquire():
+                    limit.incr("shed")
+                    return reject(503, SHED, limit.async_gate.latency_target)
+                try:
+                    limit.incr("allowed")
+                    return await handler(request)
+                finally:
+                    limit.async_gate.release()
+            return wrapped
+        return decorator
+
+    def snapshot(self):
+        return {name: limit.snapshot() for name, limit in self.endpoints.items()}
+
+
+def _reject(status, message, retry_after, json_errors):
+    if json_errors:
+        resp = make_response(jsonify({"error": message}), status)
+    else:
+        resp = make_response(f"⚠️ {message}", status)
+    resp.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return resp
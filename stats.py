@@ -0,0 +1,161 @@
+"""Precomputed dashboard statistics.
+
+Counters are kept up to date by Postgres triggers on ``users``, ``notes`` and
+``announcements``, so every write path (register, add_teacher/add_student,
+notes upload, delete_note, delete_user, ...) is covered without touching the
+routes. The dashboard and /api/dashboard/stats only read these small tables:
+
+* ``stats_counters``  - name -> value (users.<role>, notes.total,
+  storage.bytes, announcements.total, reconcile.last_run)
+* ``stats_uploaders`` - notes and bytes per uploader
+* ``activity_log``    - recent creates/deletes, pruned on reconcile
+
+The tables and triggers are created by migrations/002_dashboard_stats.sql.
+``reconcile`` recomputes everything from the base tables to correct drift;
+one process at a time runs it, at most every ``interval`` seconds.
+"""
+import os
+import random
+import threading
+import time
+
+# Any constant works as long as nothing else uses the same advisory lock key.
+RECONCILE_LOCK_KEY = 720290
+ACTIVITY_LOG_KEEP = 200
+
+RECONCILE_SQL = """
+DELETE FROM stats_counters;
+INSERT INTO stats_counters (name, value)
+    SELECT 'users.' || COALESCE(role, 'student'), COUNT(*) FROM users GROUP BY 1
+    UNION ALL SELECT 'notes.total', COUNT(*) FROM notes
+    UNION ALL SELECT 'storage.bytes', COALESCE(SUM(size_bytes), 0) FROM notes
+    UNION ALL SELECT 'announcements.total', COUNT(*) FROM announcements
+    UNION ALL SELECT 'reconcile.last_run', EXTRACT(EPOCH FROM now())::BIGINT;
+
+DELETE FROM stats_uploaders;
+INSERT INTO stats_uploaders (uploaded_by, notes, bytes)
+    SELECT uploaded_by, COUNT(*), COALESCE(SUM(size_bytes), 0)
+    FROM notes GROUP BY uploaded_by;
+
+DELETE FROM activity_log WHERE id <= (
+    SELECT id FROM activity_log ORDER BY id DESC OFFSET %(keep)s LIMIT 1
+);
+"""
+
+
+def reconcile(conn, upload_folder, max_age=0):
+    """Recompute all counters from the base tables.
+
+    Skipped (returns False) if another process is already reconciling or
+    the last run is less than ``max_age`` seconds old.
+
+    The lock is transaction-scoped: Neon's pooler (PgBouncer in transaction
+    mode) may run each transaction on a different backend, so a session lock
+    taken in one transaction could be released, or leak, on another.
+    """
+    with conn.cursor() as cur:
+        try:
+            if _last_run_age(cur) < max_age:
+                conn.rollback()
+                return False
+
+            # Notes uploaded before size tracking: take the size from disk.
+            # Only NULL sizes are written, so racing processes agree.
+            cur.execute("SELECT id, filename FROM notes WHERE size_bytes IS NULL")
+            for note_id, filename in cur.fetchall():
+                path = os.path.join(upload_folder, filename)
+                size = os.path.getsize(path) if os.path.isfile(path) else 0
+                cur.execute("UPDATE notes SET size_bytes=%s WHERE id=%s AND size_bytes IS NULL",
+                            (size, note_id))
+            conn.commit()
+
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (RECONCILE_LOCK_KEY,))
+            # Someone else may have finished a run since the first check.
+            if not cur.fetchone()[0] or _last_run_age(cur) < max_age:
+                conn.rollback()
+                return False
+
+            # Hold off writers so no trigger increment lands between the
+            # recount and the overwrite. Readers are not blocked.
+            cur.execute("LOCK TABLE users, notes, announcements IN SHARE MODE")
+            cur.execute(RECONCILE_SQL, {"keep": ACTIVITY_LOG_KEEP})
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass  # dead connection; keep the original error
+            raise
+    return True
+
+
+def _last_run_age(cur):
+    cur.execute(
+        "SELECT EXTRACT(EPOCH FROM now())::BIGINT - COALESCE("
+        "(SELECT value FROM stats_counters WHERE name = 'reconcile.last_run'), 0)"
+    )
+    return cur.fetchone()[0]
+
+
+def start_reconciler(interval, connect, upload_folder, logger):
+    """Keep stats reconciled every ``interval`` seconds from a daemon thread.
+
+    The last run time lives in the database, so workers that are recycled
+    before ``interval`` passes still take their turn. Failures (e.g. Neon
+    being unreachable) are logged and retried on the next check.
+    """
+    check_every = min(interval, 60)
+
+    def loop():
+        while True:
+            time.sleep(check_every * random.uniform(0.5, 1.5))
+            conn = None
+            try:
+                conn = connect()
+                if conn:
+                    reconcile(conn, upload_folder, max_age=interval)
+            except Exception as e:
+                logger.error(f"Stats reconcile failed: {e}")
+            finally:
+                if conn:
+                    conn.close()
+
+    thread = threading.Thread(target=loop, name="stats-reconciler", daemon=True)
+    thread.start()
+    return thread
+
+
+def read_stats(cur, top=10, recent=10):
+    """Dashboard numbers, read from the precomputed tables only."""
+    cur.execute("SELECT name, value FROM stats_counters")
+    counters = dict(cur.fetchall())
+
+    users = {name.split(".", 1)[1]: value
+             for name, value in counters.items() if name.startswith("users.")}
+
+    cur.execute(
+        "SELECT uploaded_by, notes, bytes FROM stats_uploaders "
+        "WHERE notes > 0 ORDER BY notes DESC, uploaded_by LIMIT %s", (top,)
+    )
+    uploaders = [{"uploaded_by": r[0], "notes": r[1], "bytes": r[2]} for r in cur.fetchall()]
+
+    cur.execute(
+        "SELECT kind, action, actor, detail, created_at FROM activity_log "
+        "ORDER BY id DESC LIMIT %s", (recent,)
+    )
+    activity = [
+        {"kind": r[0], "action": r[1], "actor": r[2], "detail": r[3],
+         "created_at": r[4].isoformat() if r[4] else None}
+        for r in cur.fetchall()
+    ]
+
+    return {
+        "users": users,
+        "users_total": sum(users.values()),
+        "notes": counters.get("notes.total", 0),
+        "storage_bytes": counters.get("storage.bytes", 0),
+        "announcements": counters.get("announcements.total", 0),
+        "top_uploaders": uploaders,
+        "recent_activity": activity,
+        "reconciled_at": counters.get("reconcile.last_run"),
+    }
@@ -0,0 +1,32 @@
+import os
+
+# Point the app at a closed local port so startup fails fast without a DB.
+os.environ.setdefault("DBHOST", "127.0.0.1")
+os.environ.setdefault("DBPORT", "1")
+
+import app as app_module  # noqa: E402
+
+
+def test_create_app_rebuilds_pool_from_overrides_and_is_idempotent(monkeypatch):
+    started = []
+    monkeypatch.setattr(app_module, "stats_reconciler", None)
+    monkeypatch.setattr(app_module.stats, "start_reconciler",
+                        lambda *args: started.append(args) or object())
+
+    app_module.create_app({"DB_POOL_MAX": 3, "STATS_RECONCILE_SECONDS": 60})
+    first_pool = app_module.db_pool
+    app_module.create_app({"DB_POOL_MAX": 5, "DB_HOST": "127.0.0.2"})
+
+    assert app_module.db_pool is not first_pool
+    assert app_module.db_pool.max_connections == 5
+    assert app_module.db_pool._connect_kwargs["host"] == "127.0.0.2"
+    assert len(started) == 1
+
+
+def test_metrics_token_check_handles_non_ascii_header(monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "METRICS_TOKEN", "secret")
+    client = app_module.app.test_client()
+    assert client.get("/metrics/rate_limits",
+                      headers={"Authorization": "Bearer sécret"}).status_code == 403
+    assert client.get("/metrics/rate_limits",
+                      headers={"Authorization": "Bearer secret"}).status_code == 200
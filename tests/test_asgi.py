@@ -0,0 +1,69 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("a2wsgi")
+pytest.importorskip("asyncpg")
+
+# Point the app at a closed local port so startup fails fast without a DB.
+os.environ.setdefault("DBHOST", "127.0.0.1")
+os.environ.setdefault("DBPORT", "1")
+os.environ.setdefault("STATS_RECONCILE_SECONDS", "0")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import asgi  # noqa: E402
+
+
+class FakeDB:
+    def __init__(self):
+        self.queries = []
+
+    async def fetch(self, sql, *args):
+        self.queries.append((sql, args))
+        return [(1, "notes.pdf", "teacher")]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / "notes.pdf").write_bytes(b"%PDF-1.4 test")
+    monkeypatch.setitem(asgi.flask_app.config, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(asgi.app.router, "lifespan_context", None)
+    asgi.app.state.db = FakeDB()
+    return TestClient(asgi.app)
+
+
+def test_search_uses_async_pool_and_shared_results(client):
+    resp = client.get("/search?q=notes")
+    assert resp.json() == [{"id": 1, "title": "notes.pdf", "excerpt": "Uploaded by: teacher"}]
+    sql, args = asgi.app.state.db.queries[0]
+    assert sql.endswith("ILIKE $1 LIMIT 12")
+    assert args == ("%notes%",)
+
+
+def test_uploads_are_streamed_and_confined_to_folder(client):
+    resp = client.get("/uploads/notes.pdf")
+    assert resp.status_code == 200
+    assert resp.content == b"%PDF-1.4 test"
+    assert client.get("/uploads/..%2Fapp.py").status_code == 404
+
+
+def test_request_without_peer_address_is_limited_not_500(client):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/search", "raw_path": b"/search",
+             "query_string": b"q=notes", "headers": [], "client": None}
+    asyncio.run(asgi.app(scope, receive, send))
+    assert sent[0]["status"] == 200
+
+
+def test_other_routes_fall_through_to_flask(client):
+    assert client.get("/").status_code == 200
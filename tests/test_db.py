@@ -0,0 +1,79 @@
+import pytest
+from psycopg2.pool import PoolError
+
+from db import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+
+    def rollback(self):
+        if self.closed:
+            raise Exception("connection already closed")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeConnect:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self, **kwargs):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+def make_pool(max_connections=2, timeout=0.05):
+    connect = FakeConnect()
+    return ConnectionPool(max_connections, timeout, connect=connect), connect
+
+
+def test_returned_connection_is_reused():
+    pool, connect = make_pool()
+    for _ in range(2):
+        conn = pool.connect()
+        conn.close()
+    assert len(connect.opened) == 1
+    assert not connect.opened[0].closed
+    assert connect.opened[0].rollbacks == 2
+
+
+def test_dropped_connection_goes_back_to_pool():
+    pool, connect = make_pool()
+    conn = pool.connect()
+    del conn
+    pool.connect().close()
+    assert len(connect.opened) == 1
+
+
+def test_broken_connection_is_discarded():
+    pool, connect = make_pool()
+    conn = pool.connect()
+    connect.opened[0].closed = 1
+    conn.close()
+    pool.connect().close()
+    assert len(connect.opened) == 2
+
+
+def test_waits_then_times_out_when_exhausted():
+    pool, _ = make_pool(max_connections=1)
+    held = pool.connect()
+    with pytest.raises(PoolError):
+        pool.connect()
+    held.close()
+    pool.connect().close()
+
+
+def test_close_all_closes_idle_and_returned_connections():
+    pool, connect = make_pool()
+    idle = pool.connect()
+    borrowed = pool.connect()
+    idle.close()
+    pool.close_all()
+    borrowed.close()
+    assert all(c.closed for c in connect.opened)
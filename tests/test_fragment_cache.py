@@ -0,0 +1,89 @@
+from markupsafe import Markup
+
+from fragment_cache import FragmentCache
+
+
+class Renderer:
+    def __init__(self, html="<div>card</div>"):
+        self.html = html
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.html
+
+
+def test_hit_reuses_markup_until_version_changes():
+    cache = FragmentCache()
+    render = Renderer()
+    row = (1, "notes.pdf", "teacher")
+
+    first = cache.get_or_render("note", 1, cache.version_of(row), render)
+    second = cache.get_or_render("note", 1, cache.version_of(row), render)
+    assert isinstance(first, Markup)
+    assert first is second
+    assert render.calls == 1
+
+    edited = (1, "notes-v2.pdf", "teacher")
+    cache.get_or_render("note", 1, cache.version_of(edited), render)
+    assert render.calls == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_dict_rows_are_versioned_by_value():
+    cache = FragmentCache()
+    row = {"id": 1, "content": "hi", "author": "a"}
+    assert cache.version_of(row) == (1, "hi", "a")
+    assert cache.version_of(dict(row, content="bye")) != cache.version_of(row)
+
+
+def test_invalidate_forces_rerender_and_frees_bytes():
+    cache = FragmentCache()
+    render = Renderer()
+    cache.get_or_render("announcement", 7, (7, "x"), render)
+    assert cache.stats()["bytes"] > 0
+
+    cache.invalidate("announcement", 7)
+    assert cache.stats()["bytes"] == 0
+    cache.get_or_render("announcement", 7, (7, "x"), render)
+    assert render.calls == 2
+
+
+def test_lru_eviction_keeps_bytes_under_budget():
+    probe = FragmentCache()
+    probe.get_or_render("note", 0, (0,), Renderer())
+    entry_size = probe.stats()["bytes"]
+
+    cache = FragmentCache(max_bytes=entry_size * 3)
+    for i in range(3):
+        cache.get_or_render("note", i, (i,), Renderer())
+    cache.get_or_render("note", 0, (0,), Renderer())  # touch 0 so 1 is oldest
+    cache.get_or_render("note", 3, (3,), Renderer())
+
+    stats = cache.stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] == 1
+    render = Renderer()
+    cache.get_or_render("note", 0, (0,), render)
+    assert render.calls == 0
+    cache.get_or_render("note", 1, (1,), render)
+    assert render.calls == 1
+
+
+def test_oversize_fragment_is_returned_but_not_cached():
+    cache = FragmentCache(max_bytes=64)
+    render = Renderer("<div>" + "x" * 500 + "</div>")
+    html = cache.get_or_render("note", 1, (1,), render)
+    assert "x" * 500 in html
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_stats_report_hits_misses_and_ratio():
+    cache = FragmentCache()
+    render = Renderer()
+    for _ in range(4):
+        cache.get_or_render("note", 1, (1,), render)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+    assert stats["hit_ratio"] == 0.75
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from flask import Flask
+
+from ratelimit import ConcurrencyGate, MemoryBucketBackend, RateLimiter
+
+
+def test_gate_sheds_fast_once_queueing_hits_target():
+    gate = ConcurrencyGate(max_concurrent=1, latency_target=0.05)
+    assert gate.acquire()  # hold the only slot
+
+    # Each queued request times out after the full target...
+    for _ in range(10):
+        assert not gate.acquire()
+
+    # ...until the average is close enough to it that new ones fail at once.
+    start = time.monotonic()
+    assert not gate.acquire()
+    assert time.monotonic() - start < 0.01
+
+    # A free slot records a zero wait and brings the average back down.
+    gate.release()
+    for _ in range(10):
+        assert gate.acquire()
+        gate.release()
+    assert not gate._overloaded()
+
+
+def test_sweep_keeps_slow_buckets_of_other_endpoints():
+    backend = MemoryBucketBackend()
+    for _ in range(5):
+        backend.take("login:ip:1.2.3.4", rate=0.2, burst=5)
+    assert not backend.take("login:ip:1.2.3.4", rate=0.2, burst=5)[0]
+
+    backend._last_sweep = 0  # force a sweep on the next take
+    backend.take("search:ip:1.2.3.4", rate=5.0, burst=20)
+    assert "login:ip:1.2.3.4" in backend._buckets
+    assert not backend.take("login:ip:1.2.3.4", rate=0.2, burst=5)[0]
+
+
+def make_app():
+    app = Flask(__name__)
+    app.secret_key = "test"
+    limiter = RateLimiter()
+    limiter.init_app(app)
+
+    @app.route("/login", methods=["POST"])
+    @limiter.limit("login")
+    def login():
+        return "ok"
+
+    return app, limiter
+
+
+def test_login_is_limited_per_submitted_username():
+    app, limiter = make_app()
+    client = app.test_client()
+
+    statuses = [client.post("/login", data={"username": "alice"}).status_code
+                for _ in range(6)]
+    assert statuses == [200] * 5 + [429]
+
+    # Another student behind the same address is unaffected.
+    assert client.post("/login", data={"username": "bob"}).status_code == 200
+    assert limiter.snapshot()["login"]["throttled"] == 1
+
+
+def test_throttled_response_has_retry_after():
+    app, _ = make_app()
+    client = app.test_client()
+    for _ in range(5):
+        client.post("/login", data={"username": "alice"})
+    resp = client.post("/login", data={"username": "alice"})
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+
+
+def test_gate_caps_concurrency():
+    gate = ConcurrencyGate(max_concurrent=2, latency_target=0.05)
+    peak = []
+    lock = threading.Lock()
+
+    def worker():
+        if gate.acquire():
+            with lock:
+                peak.append(gate.in_flight)
+            time.sleep(0.01)
+            gate.release()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(peak) <= 2
+
+
+def test_login_lockout_needs_the_victims_ip():
+    app, _ = make_app()
+    client = app.test_client()
+    attacker = {"REMOTE_ADDR": "203.0.113.9"}
+    victim = {"REMOTE_ADDR": "198.51.100.7"}
+
+    for _ in range(6):
+        client.post("/login", data={"username": "teacher"}, environ_base=attacker)
+    assert client.post("/login", data={"username": "teacher"},
+                       environ_base=attacker).status_code == 429
+    assert client.post("/login", data={"username": "Teacher"},
+                       environ_base=victim).status_code == 200
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+
+    def fetchone(self):
+        return (4.0,)
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_postgres_backend_reuses_one_pooled_connection():
+    from db import ConnectionPool
+    from ratelimit import PostgresBucketBackend
+
+    opened = []
+    pool = ConnectionPool(2, 0.05, connect=lambda: opened.append(FakeConnection()) or opened[-1])
+    backend = PostgresBucketBackend(pool)
+    for _ in range(5):
+        assert backend.take("search:ip:1.2.3.4", rate=5.0, burst=20) == (True, 0.0)
+    assert len(opened) == 1
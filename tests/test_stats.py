@@ -0,0 +1,80 @@
+import pytest
+
+import stats
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        if self.conn.fail_on and self.conn.fail_on in sql:
+            raise RuntimeError("connection lost")
+        if "reconcile.last_run" in sql and "SELECT EXTRACT" in sql:
+            self.result = [(self.conn.age,)]
+        elif "pg_try_advisory_xact_lock" in sql:
+            self.result = [(self.conn.lock_free,)]
+        elif "size_bytes IS NULL" in sql and sql.startswith("SELECT"):
+            self.result = []
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, age=10_000, lock_free=True, fail_on=None, dead_after_error=False):
+        self.age = age
+        self.lock_free = lock_free
+        self.fail_on = fail_on
+        self.dead_after_error = dead_after_error
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        if self.dead_after_error:
+            raise RuntimeError("connection already closed")
+
+
+def test_recount_takes_transaction_scoped_lock_only():
+    conn = FakeConnection()
+    assert stats.reconcile(conn, "uploads", max_age=3600)
+    sql = "\n".join(conn.executed)
+    assert "pg_try_advisory_xact_lock" in sql
+    assert "pg_try_advisory_lock(" not in sql
+    assert "pg_advisory_unlock" not in sql
+    lock = conn.executed.index(next(s for s in conn.executed if "xact_lock" in s))
+    recount = conn.executed.index(stats.RECONCILE_SQL)
+    assert lock < recount
+
+
+def test_skips_when_recent_or_locked():
+    fresh = FakeConnection(age=10)
+    assert not stats.reconcile(fresh, "uploads", max_age=3600)
+    assert stats.RECONCILE_SQL not in fresh.executed
+
+    locked = FakeConnection(lock_free=False)
+    assert not stats.reconcile(locked, "uploads", max_age=3600)
+    assert stats.RECONCILE_SQL not in locked.executed
+
+
+def test_original_error_survives_dead_connection():
+    conn = FakeConnection(fail_on="LOCK TABLE", dead_after_error=True)
+    with pytest.raises(RuntimeError, match="connection lost"):
+        stats.reconcile(conn, "uploads")